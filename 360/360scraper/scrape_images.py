@@ -1,64 +1,421 @@
 import os
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+from io import BytesIO
+from lxml import etree
+from urllib.parse import urljoin, urlparse, urlunparse, parse_qsl, urlencode
 import time
 import json
 import re
+import hashlib
 import csv
 import shutil
 from tqdm.asyncio import tqdm as tqdm_asyncio  # Import tqdm for asyncio
 from datetime import datetime, timedelta
 import asyncio
+import itertools
 import aiohttp
-from concurrent.futures import ThreadPoolExecutor
+import aiofiles
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+try:
+    import brotli  # Lets aiohttp decode "br" encoded pages
+    PAGE_ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    PAGE_ACCEPT_ENCODING = "gzip, deflate"
+
+try:
+    import orjson  # Much faster (de)serialization of the sitemap, crawl progress and image cache
+except ImportError:
+    orjson = None
+
+CRAWL_WORKERS = 20
+PAGE_WORKERS = 16
+DOWNLOAD_CONCURRENCY = 10
+DOWNLOAD_CHUNK_SIZE = 1 << 16  # 64 KiB, in line with typical socket buffer sizes
+MAX_IMAGE_BYTES = 100 << 20  # 100 MiB, well above the largest panoramas
+SITEMAP_MAX_AGE = timedelta(days=7)
+IMAGE_CACHE_MAX_AGE = timedelta(days=7)
+CRAWL_CHECKPOINT_INTERVAL = 100  # pages
+
+# Pages must arrive within PAGE_TIMEOUT. Other requests (large panorama images) may take as long as
+# they need, but fail once the connection stalls.
+PAGE_TIMEOUT = aiohttp.ClientTimeout(total=10)
+SESSION_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=30)
+
+# Transient failures are retried with exponential backoff: 0.3 s, 0.6 s, 1.2 s
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.3
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Links create_sitemap never follows: static assets, feeds and WordPress endpoints without x-column content
+SKIP_SUFFIXES = (".css", ".js", ".ico", ".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".pdf", ".xml",
+                 ".txt", ".woff", ".woff2", ".zip", "/feed", "/feed/")
+# Query parameters that never change page content, dropped from crawled URLs. Names are matched exactly,
+# except for the utm_ family, so look-alikes such as ?_gallery=2 are kept.
+TRACKING_PARAMS = {"fbclid", "gclid", "msclkid", "mc_cid", "mc_eid", "_ga", "_gl"}
+TRACKING_PARAM_PREFIXES = ("utm_",)
+SKIP_PREFIXES = ("/wp-admin/", "/wp-json/", "/wp-content/", "/wp-includes/", "/wp-login.php", "/xmlrpc.php")
+
+# clean_filename runs for every container, so its patterns are compiled once
+_RE_NONWORD = re.compile(r"[^\w\s-]")
+_RE_SPACE = re.compile(r"[\s_-]+")
+
+# Per-container lookup used by parse_page, compiled once: the heading span inside the first link and
+# the first <img>, fetched together in one evaluation. Class tests match whole class tokens.
+XP_CONTAINER_FIELDS = etree.XPath(
+    "((.//a)[1]//span[contains(concat(' ', normalize-space(@class), ' '), ' heading ')])[1] | (.//img)[1]"
+)
+# Comments and processing instructions never hold anything we extract, so they are not turned into nodes
+ITERPARSE_OPTIONS = {"remove_comments": True, "remove_pis": True}
 
 def clean_filename(filename):
     """Cleans a filename by removing special characters and replacing spaces/underscores with hyphens."""
     name, ext = os.path.splitext(filename)
-    name = re.sub(r"[^\w\s-]", "", name).strip()
-    name = re.sub(r"[\s_-]+", "-", name)
-    # Remove double dots
-    name = re.sub(r"\.\.+", ".", name)
+    # Dots are special characters too, so this also removes any double dots
+    name = _RE_NONWORD.sub("", name).strip()
+    name = _RE_SPACE.sub("-", name)
     name = name.lower()
     return f"{name}{ext}"
 
-async def download_or_replace_image(session, image_url, local_filepath, headers, log_data):
+def get_file_size(filepath):
+    """Returns the size of a file in bytes, or None if it does not exist."""
+    try:
+        return os.path.getsize(filepath)
+    except OSError:
+        return None
+
+def read_json(filepath):
+    """Loads a JSON file, using orjson when it is installed."""
+    if orjson is not None:
+        with open(filepath, "rb") as f:
+            return orjson.loads(f.read())
+    with open(filepath, "r") as f:
+        return json.load(f)
+
+def write_json(filepath, data, indent=False):
+    """Writes data to a JSON file, using orjson when it is installed. indent pretty-prints with 2 spaces."""
+    if orjson is not None:
+        with open(filepath, "wb") as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else 0))
+    else:
+        with open(filepath, "w") as f:
+            json.dump(data, f, indent=2 if indent else None)
+
+def decode_for_lxml(html_bytes, encoding):
+    """
+    Returns the page as UTF-8 bytes. encoding is the charset the response was served with
+    (response.get_encoding()); lxml would otherwise guess from the bytes and fall back to Latin-1.
+    Python decodes it, since libxml2 does not know every codec name Python does.
+    """
+    if encoding == "utf-8":
+        return html_bytes
+    return html_bytes.decode(encoding, errors="replace").encode("utf-8")
+
+def parse_page(html_bytes, encoding="utf-8"):
+    """
+    Parses a page and returns a (project_name, src) tuple for every x-column container, in document order.
+    project_name is None when the container has no heading; src is None when it has no <img>.
+    Returns plain picklable data so it can run in a ProcessPoolExecutor.
+    The page is stream-parsed and each outermost container is discarded once read, so memory stays flat on
+    large pages. Nested containers are read when they close but kept until their outermost container has
+    been read too, since they are part of its content.
+    """
+    items = []
+    if not html_bytes.strip():
+        return items
+    html_bytes = decode_for_lxml(html_bytes, encoding)
+    # items index of each x-column container that is open at the current point of the parse
+    open_containers = []
+    for event, container in etree.iterparse(BytesIO(html_bytes), events=("start", "end"), tag="div", html=True, encoding="utf-8", **ITERPARSE_OPTIONS):
+        if "x-column" not in (container.get("class") or "").split():
+            continue
+        if event == "start":
+            # Reserve the container's slot now, so items come out in start-tag order
+            open_containers.append(len(items))
+            items.append(None)
+            continue
+
+        project_name = src = None
+        for node in XP_CONTAINER_FIELDS(container):
+            if node.tag == "img":
+                src = node.get("src", "")
+            else:
+                project_name = "".join(node.itertext()).strip()
+        items[open_containers.pop()] = (project_name, src)
+
+        if not open_containers:
+            # Drop the container and everything already parsed before it
+            container.clear(keep_tail=True)
+            while container.getprevious() is not None:
+                del container.getparent()[0]
+    return items
+
+def parse_links(html_bytes, encoding="utf-8"):
+    """
+    Parses a page and returns the href of every <a> tag. Runs in a ProcessPoolExecutor.
+    The page is stream-parsed and every element is cleared once closed, since only hrefs are needed.
+    """
+    hrefs = []
+    if not html_bytes.strip():
+        return hrefs
+    html_bytes = decode_for_lxml(html_bytes, encoding)
+    for _, elem in etree.iterparse(BytesIO(html_bytes), events=("end",), html=True, encoding="utf-8", **ITERPARSE_OPTIONS):
+        if elem.tag == "a":
+            href = elem.get("href")
+            if href is not None:
+                hrefs.append(href)
+        elem.clear(keep_tail=True)
+    return hrefs
+
+def file_digest(filepath):
+    """Returns the blake2b digest of a file's contents as used in content_index, or None if it cannot be read."""
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with open(filepath, "rb") as f:
+            for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+def link_duplicate(original_filepath, duplicate_filepath):
+    """
+    Replaces duplicate_filepath with a hard link to original_filepath, so identical images share one
+    copy on disk. Returns False, leaving the duplicate in place, if the filesystem refuses the link.
+    """
+    temp_filepath = f"{duplicate_filepath}.link"
+    try:
+        os.link(original_filepath, temp_filepath)
+        os.replace(temp_filepath, duplicate_filepath)
+        return True
+    except OSError:
+        return False
+
+async def run_worker_pool(queue, handle, num_workers):
+    """
+    Drains an asyncio.Queue with num_workers coroutines, each awaiting handle(item) for the items it
+    takes. handle may put further items on the queue. Returns once every queued item has been handled.
+    If handle raises, the remaining workers are stopped and the exception is re-raised here rather
+    than leaving the queue waiting on a dead worker.
+    """
+    async def worker():
+        while True:
+            item = await queue.get()
+            try:
+                await handle(item)
+            finally:
+                queue.task_done()
+
+    workers = [asyncio.create_task(worker()) for _ in range(num_workers)]
+    join = asyncio.create_task(queue.join())
+    try:
+        # Workers never return on their own, so one finishing before the join means handle() raised
+        await asyncio.wait([join, *workers], return_when=asyncio.FIRST_COMPLETED)
+        for task in workers:
+            if task.done():
+                task.result()
+    finally:
+        join.cancel()
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(join, *workers, return_exceptions=True)
+
+def parse_crawl_delay(robots_txt, user_agent):
+    """
+    Returns the Crawl-delay in seconds that robots.txt sets for user_agent, falling back to the "*" group,
+    or 0 if there is none. urllib.robotparser only accepts whole seconds, so fractional delays such as
+    0.5 are read here instead. Groups are matched the way robotparser does: the agent's product name
+    contains the group's token.
+    """
+    product = user_agent.split("/")[0].lower()
+    delays = {}  # group token -> delay
+    agents = []
+    in_rules = False
+    for line in robots_txt.splitlines():
+        field, _, value = line.split("#", 1)[0].partition(":")
+        field, value = field.strip().lower(), value.strip()
+        if field == "user-agent":
+            # A user-agent line after rules starts a new group
+            if in_rules:
+                agents, in_rules = [], False
+            agents.append(value.lower())
+        elif field:
+            in_rules = True
+            if field == "crawl-delay":
+                try:
+                    delay = float(value)
+                except ValueError:
+                    continue
+                if not 0 <= delay < float("inf"):  # also rejects nan
+                    continue
+                for agent in agents:
+                    delays.setdefault(agent, delay)
+    for agent, delay in delays.items():
+        if agent != "*" and agent in product:
+            return delay
+    return delays.get("*", 0)
+
+class HostRateLimiter:
+    """
+    Spaces out requests to each host by the Crawl-delay its robots.txt asks for. One instance is shared
+    by every worker, so the delay bounds the combined request rate to a host rather than each worker's.
+    Hosts without a Crawl-delay (or without a readable robots.txt) are not throttled.
+    """
+    def __init__(self, session):
+        self.session = session
+        self.delays = {}  # netloc -> task resolving to the seconds between requests (0 for none)
+        self.next_slot = {}  # netloc -> loop time at which the next request may start
+
+    async def fetch_crawl_delay(self, scheme, netloc):
+        """Reads Crawl-delay from the host's robots.txt for our User-Agent (parse_crawl_delay); 0 if there is none."""
+        try:
+            async with self.session.get(f"{scheme}://{netloc}/robots.txt", timeout=PAGE_TIMEOUT) as response:
+                if response.status != 200:
+                    return 0
+                robots_txt = await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError, UnicodeDecodeError):
+            return 0
+        delay = parse_crawl_delay(robots_txt, self.session.headers.get("User-Agent", "*"))
+        if delay:
+            print(f"Honouring Crawl-delay of {delay}s for {netloc}")
+        return delay
+
+    async def wait(self, url):
+        """Waits until the next request to url's host is allowed to start."""
+        parsed_url = urlparse(url)
+        netloc = parsed_url.netloc.lower()
+        if netloc not in self.delays:
+            self.delays[netloc] = asyncio.ensure_future(self.fetch_crawl_delay(parsed_url.scheme, netloc))
+        # Shielded so a cancelled waiter does not cancel the lookup the other workers are waiting on
+        delay = await asyncio.shield(self.delays[netloc])
+        if not delay:
+            return
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self.next_slot.get(netloc, now))
+        self.next_slot[netloc] = slot + delay
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+async def get_with_retries(session, limiter, url, **kwargs):
+    """
+    Issues a GET through the shared session, retrying connection errors, timeouts and transient
+    statuses (RETRY_STATUSES) with exponential backoff. Every attempt waits for its turn on the
+    host's rate limiter first. Use the returned response with async with so its connection is
+    released back to the pool.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        await limiter.wait(url)
+        try:
+            response = await session.get(url, **kwargs)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if attempt == MAX_RETRIES:
+                raise
+        else:
+            if response.status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                return response
+            response.release()
+        await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+async def download_or_replace_image(session, limiter, image_url, local_filepath, log_data, image_cache, content_index):
     """
-    Downloads an image from a URL, or replaces an existing image if it's a different size.
-    Uses aiohttp for asynchronous requests.
+    Downloads an image from a URL, or replaces an existing image if it has changed on the server.
+    A local file that still matches the size recorded in image_cache is trusted without any request
+    while its entry is younger than IMAGE_CACHE_MAX_AGE. Older entries are revalidated with a
+    conditional GET using the recorded ETag/Last-Modified, so an unchanged image costs a single
+    304 response with no body.
+    Downloads are hashed while streaming. If a full response turns out to hold the same bytes as the
+    local file, the file is left untouched; when the bytes match another image on disk (content_index
+    maps digests to files, and the file is re-hashed first in case it changed), the new file is
+    hard-linked to that copy. Files are written under a temporary name and renamed into place, so a
+    linked copy is never modified through its twin.
+    Responses that are not images, or that announce more than MAX_IMAGE_BYTES, are skipped unread.
+    File I/O is kept off the event loop via aiofiles and the default executor.
     """
+    loop = asyncio.get_running_loop()
     try:
         # Check if the file already exists
-        if os.path.exists(local_filepath):
-            # Get the existing file's size
-            existing_size = os.path.getsize(local_filepath)
-
-            # Get the remote file's size
-            async with session.head(image_url, headers=headers) as head_response:
-                head_response.raise_for_status()
-                remote_size = int(head_response.headers.get('Content-Length', 0))
-
-            # Compare sizes
-            if existing_size == remote_size:
-                print(f"Image '{local_filepath}' already exists and is the correct size. Skipping download.")
-                log_data["skipped"].append({"url": image_url, "reason": "already exists and correct size"})
+        existing_size = await loop.run_in_executor(None, get_file_size, local_filepath)
+
+        # Images are already compressed, so ask for them as-is
+        request_headers = {"Accept-Encoding": "identity"}
+        cached = image_cache.get(image_url)
+        # The local file is still exactly what the last download wrote
+        local_matches_cache = bool(cached) and cached.get("filepath") == local_filepath and cached.get("size") == existing_size
+        if local_matches_cache:
+            if time.time() - cached["checked"] < IMAGE_CACHE_MAX_AGE.total_seconds():
+                print(f"Image '{local_filepath}' matches the image cache. Skipping download.")
+                log_data["skipped"].append({"url": image_url, "reason": "unchanged since last download"})
+                return  # Skip download
+            if cached.get("etag"):
+                request_headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                request_headers["If-Modified-Since"] = cached["last_modified"]
+
+        async with await get_with_retries(session, limiter, image_url, headers=request_headers) as response:
+            if response.status == 304:
+                cached["checked"] = time.time()
+                print(f"Image '{local_filepath}' has not changed on the server. Skipping download.")
+                log_data["skipped"].append({"url": image_url, "reason": "not modified since last download"})
                 return  # Skip download
-            else:
-                print(f"Image '{local_filepath}' exists but is a different size. Replacing...")
-                log_data["replaced"].append({"url": image_url, "old_size": existing_size, "new_size": remote_size})
-                #remove the file before writing the new one.
-                os.remove(local_filepath)
-
-        # Download the image (if it doesn't exist or needs replacement)
-        async with session.get(image_url, headers=headers) as response:
             response.raise_for_status()
-            with open(local_filepath, 'wb') as file:
-                while True:
-                    chunk = await response.content.read(1024)
-                    if not chunk:
-                        break
-                    file.write(chunk)
+
+            # Misconfigured sites answer image URLs with HTML error pages or huge files; the headers
+            # tell us before any of the body is read
+            content_type = response.headers.get("Content-Type", "image/").split(";")[0].strip().lower()
+            if not content_type.startswith("image/"):
+                print(f"'{image_url}' is not an image ({content_type}). Skipping download.")
+                log_data["skipped"].append({"url": image_url, "reason": f"not an image ({content_type})"})
+                return
+            if response.content_length is not None and response.content_length > MAX_IMAGE_BYTES:
+                print(f"'{image_url}' is {response.content_length} bytes, over the {MAX_IMAGE_BYTES} byte limit. Skipping download.")
+                log_data["skipped"].append({"url": image_url, "reason": f"larger than {MAX_IMAGE_BYTES} bytes"})
+                return
+
+            digest = hashlib.blake2b(digest_size=16)
+            temp_filepath = f"{local_filepath}.part"
+            try:
+                async with aiofiles.open(temp_filepath, 'wb') as file:
+                    async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                        digest.update(chunk)
+                        await file.write(chunk)
+            except BaseException:
+                if os.path.exists(temp_filepath):
+                    os.remove(temp_filepath)
+                raise
+
+        content_digest = digest.hexdigest()
+        if local_matches_cache and cached.get("digest") == content_digest:
+            # The server sent the same bytes again (no validators, or it ignored them): keep the file on disk
+            await loop.run_in_executor(None, os.remove, temp_filepath)
+            cached.update(etag=response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified"), checked=time.time())
+            print(f"Image '{local_filepath}' content is unchanged. Keeping existing file.")
+            log_data["skipped"].append({"url": image_url, "reason": "content unchanged since last download"})
+            return
+        await loop.run_in_executor(None, os.replace, temp_filepath, local_filepath)
+        # The file no longer holds the bytes it was indexed under
+        if local_matches_cache and content_index.get(cached.get("digest")) == local_filepath:
+            del content_index[cached["digest"]]
+
+        original_filepath = content_index.setdefault(content_digest, local_filepath)
+        if original_filepath != local_filepath:
+            # The index is loaded from the cache, so its file may have changed since; only link to the same bytes
+            if await loop.run_in_executor(None, file_digest, original_filepath) != content_digest:
+                content_index[content_digest] = local_filepath
+            elif await loop.run_in_executor(None, link_duplicate, original_filepath, local_filepath):
+                print(f"Image '{local_filepath}' is identical to '{original_filepath}'. Hard-linked.")
+
+        new_size = await loop.run_in_executor(None, get_file_size, local_filepath)
+        image_cache[image_url] = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "size": new_size,
+            "filepath": local_filepath,
+            "checked": time.time(),
+            "digest": content_digest,
+        }
+
+        if existing_size is not None:
+            print(f"Image '{local_filepath}' changed on the server. Replaced.")
+            log_data["replaced"].append({"url": image_url, "old_size": existing_size, "new_size": new_size})
 
         print(f"Image downloaded and saved to '{local_filepath}'.")
         log_data["downloaded"].append({"url": image_url, "filepath": local_filepath})
@@ -70,40 +427,44 @@ async def download_or_replace_image(session, image_url, local_filepath, headers,
         print(f"An error occurred while processing '{image_url}': {e}")
         log_data["errors"].append({"url": image_url, "error": str(e)})
 
-async def scrape_images(session, url, headers, base_dir, csv_writer, csv_buffer, pbar, log_data):
-    """Scrapes images from a given URL, extracting project names and organizing them into subfolders."""
+async def scrape_images(session, limiter, url, main_folder_path, pbar, log_data, pool):
+    """
+    Scrapes images from a given URL, extracting project names and organizing them into subfolders.
+    Nothing is downloaded or created on disk here: returns an (image_url, filepath, csv_row) tuple per
+    image so the caller can deduplicate images shared between pages before downloading them.
+    HTML parsing is offloaded to the process pool so it does not block the event loop.
+    """
     print(f"scrape_images called for URL: {url}")
-    TIMEOUT = 10
-    DELAY = 0.1
+    loop = asyncio.get_running_loop()
 
     try:
-        async with session.get(url, headers=headers, timeout=TIMEOUT) as response:
+        async with await get_with_retries(session, limiter, url, headers={"Accept-Encoding": PAGE_ACCEPT_ENCODING}, timeout=PAGE_TIMEOUT) as response:
             response.raise_for_status()
-            soup = BeautifulSoup(await response.text(), "html.parser")
+            html_bytes = await response.read()
+            encoding = response.get_encoding()
+        items = await loop.run_in_executor(pool, parse_page, html_bytes, encoding)
     except aiohttp.ClientError as e:
         print(f"Error fetching URL {url}: {e}")
         log_data["errors"].append({"url": url, "error": str(e)})
-        return
+        pbar.update(1)
+        return []
+    except Exception as e:
+        print(f"An error occurred while scraping '{url}': {e}")
+        log_data["errors"].append({"url": url, "error": str(e)})
+        pbar.update(1)
+        return []
 
     parsed_url = urlparse(url)
     path_parts = parsed_url.path.strip("/").split("/")
     subfolder_name = "root" if not path_parts or path_parts == [''] else "-".join(path_parts)
     subfolder_name = clean_filename(subfolder_name)
 
-    main_folder_name = "360_images"
-    main_folder_path = os.path.join(base_dir, main_folder_name)
     subfolder_path = os.path.join(main_folder_path, subfolder_name)
-    os.makedirs(subfolder_path, exist_ok=True)
 
     image_counter = 1
-    tasks = []
-
-    containers = soup.find_all("div", class_="x-column")
-    for container in containers:
-        a_tag = container.find("a")
-        project_name_span = a_tag.find("span", class_="heading") if a_tag else None
-        project_name = project_name_span.text.strip() if project_name_span else None
+    images = []
 
+    for project_name, src in items:
         filename = subfolder_name if project_name is None else project_name
         filename = clean_filename(filename)
 
@@ -111,68 +472,175 @@ async def scrape_images(session, url, headers, base_dir, csv_writer, csv_buffer,
             filename = f"{filename}-{image_counter}"
             image_counter += 1
 
-        img = container.find("img")
-        if not img:
+        if src is None:
             print(f"No image found in container for project: {filename}")
             log_data["skipped"].append({"url": url, "reason": f"No image found in container for project: {filename}"})
-            pbar.update(1)
             continue
 
-        src = img.get("src")
         if not src or src.startswith("data:"):
             print(f"Skipping image with invalid src in project: {filename}")
             log_data["skipped"].append({"url": url, "reason": f"Skipping image with invalid src in project: {filename}"})
-            pbar.update(1)
+            continue
+
+        try:
+            image_url = urljoin(url, src)
+        except ValueError as e:
+            # Malformed srcs such as "http://[bad/x.jpg" cannot be resolved; skip them, not the rest of the page
+            print(f"Skipping image with malformed src in project: {filename}")
+            log_data["skipped"].append({"url": url, "reason": f"Skipping image with malformed src '{src}' in project: {filename} ({e})"})
             continue
 
         ext = os.path.splitext(src)[1].split("?")[0] or ".jpg"
-        image_url = urljoin(url, src)
         filepath = os.path.join(subfolder_path, f"{filename}{ext}")
+        csv_row = [src, parsed_url.path, f"{filename}{ext}", subfolder_name]
+        images.append((image_url, filepath, csv_row))
 
-        # Use the new function to download or replace the image
-        tasks.append(download_or_replace_image(session, image_url, filepath, headers, log_data))
+    pbar.update(1)
 
-        # Write data to CSV
-        csv_buffer.append([src, parsed_url.path, f"{filename}{ext}", subfolder_name])
+    print(f"Finished scraping {url}")
+    return images
 
-        await asyncio.sleep(DELAY)
+def is_tracking_param(key):
+    """Returns True for query parameters that only track visits (TRACKING_PARAMS, TRACKING_PARAM_PREFIXES)."""
+    key = key.lower()
+    return key in TRACKING_PARAMS or key.startswith(TRACKING_PARAM_PREFIXES)
 
-    await asyncio.gather(*tasks)
-    pbar.update(len(containers))
+def strip_tracking(url):
+    """
+    Returns the URL the crawler fetches and stores for a link: fragment and tracking parameters removed,
+    everything else spelled as found so servers are not asked for a form that redirects.
+    """
+    parsed = urlparse(url)
+    query = parsed.query
+    pairs = parse_qsl(query, keep_blank_values=True)
+    if any(is_tracking_param(key) for key, _ in pairs):
+        query = urlencode([(key, value) for key, value in pairs if not is_tracking_param(key)])
+    return urlunparse(parsed._replace(query=query, fragment=""))
+
+def canonicalize_url(url):
+    """
+    Returns the form of a URL used to decide whether two links point at the same page: lower-case scheme
+    and host, no fragment or trailing slash, tracking parameters dropped and the remaining query sorted.
+    """
+    parsed = urlparse(url)
+    query = sorted((key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+                   if not is_tracking_param(key))
+    path = parsed.path.rstrip("/") or "/"
+    return urlunparse((parsed.scheme.lower(), parsed.netloc.lower(), path, parsed.params, urlencode(query), ""))
 
-    print(f"Finished scraping {url}")
+def url_hash(url):
+    """
+    Returns a 64-bit hash of a URL's canonical form, so permutations of the same page share a hash.
+    The crawler keeps these in its membership sets instead of the URL strings, which is several times
+    smaller per entry; collisions are negligible at crawl sizes.
+    """
+    return int.from_bytes(hashlib.blake2b(canonicalize_url(url).encode(), digest_size=8).digest(), "big")
 
-async def create_sitemap(session, base_url, headers, base_dir, log_data):
-    """Creates a sitemap of the website by scraping all internal links."""
-    sitemap = set()
-    to_visit = {base_url}
-    visited = set()
+def save_crawl_progress(progress_filepath, visited, to_visit, sitemap):
+    """Atomically writes the crawl state to disk (write to a temporary file, then rename over the old one)."""
+    temp_filepath = f"{progress_filepath}.tmp"
+    write_json(temp_filepath, {"visited": list(visited), "to_visit": list(to_visit), "sitemap": list(sitemap)})
+    os.replace(temp_filepath, progress_filepath)
 
-    while to_visit:
-        url = to_visit.pop()
-        if url in visited:
-            continue
-        visited.add(url)
+def save_image_cache(image_cache_filepath, image_cache):
+    """Atomically writes the image cache to disk, so an interrupted write never leaves a truncated file."""
+    temp_filepath = f"{image_cache_filepath}.tmp"
+    write_json(temp_filepath, image_cache, indent=True)
+    os.replace(temp_filepath, image_cache_filepath)
 
+async def create_sitemap(session, limiter, base_url, base_dir, log_data, pool):
+    """
+    Creates a sitemap of the website by crawling all internal links with a pool of worker coroutines.
+    Link extraction runs in the process pool. Progress is checkpointed to sitemap_progress.json every
+    CRAWL_CHECKPOINT_INTERVAL pages and when the crawl is interrupted, and an interrupted crawl
+    resumes from it if it is recent enough.
+    """
+    loop = asyncio.get_running_loop()
+    base_netloc = urlparse(base_url).netloc.lower()
+    progress_filepath = os.path.join(base_dir, "sitemap_progress.json")
+
+    sitemap = set()
+    # url_hash of every page already fetched (successfully or not)
+    visited = set()
+    to_visit = [strip_tracking(base_url)]
+
+    if os.path.exists(progress_filepath):
+        progress_age = datetime.now() - datetime.fromtimestamp(os.path.getmtime(progress_filepath))
+        if progress_age <= SITEMAP_MAX_AGE:
+            progress = read_json(progress_filepath)
+            sitemap = set(progress["sitemap"])
+            visited = set(progress["visited"])
+            to_visit = progress["to_visit"]
+            print(f"Resuming sitemap crawl: {len(visited)} pages visited, {len(to_visit)} queued.")
+
+    # URLs queued but not fetched yet, the only URL strings the crawl keeps besides the sitemap
+    pending = set(to_visit)
+    # url_hash of every URL ever enqueued, so each page is fetched at most once
+    seen = visited | {url_hash(url) for url in pending}
+    queue = asyncio.Queue()
+    for url in to_visit:
+        queue.put_nowait(url)
+
+    async def crawl_page(url):
         try:
-            async with session.get(url, headers=headers, timeout=10) as response:
+            async with await get_with_retries(session, limiter, url, headers={"Accept-Encoding": PAGE_ACCEPT_ENCODING}, timeout=PAGE_TIMEOUT) as response:
                 response.raise_for_status()
-                soup = BeautifulSoup(await response.text(), "html.parser")
+                html_bytes = await response.read()
+                encoding = response.get_encoding()
+            hrefs = await loop.run_in_executor(pool, parse_links, html_bytes, encoding)
         except aiohttp.ClientError as e:
             print(f"Error fetching URL {url}: {e}")
             log_data["errors"].append({"url": url, "error": str(e)})
-            continue
+            return
+        except Exception as e:
+            print(f"An error occurred while crawling '{url}': {e}")
+            log_data["errors"].append({"url": url, "error": str(e)})
+            return
 
         sitemap.add(url)
 
-        for link in soup.find_all("a", href=True):
-            absolute_url = urljoin(base_url, link["href"])
-            parsed_absolute_url = urlparse(absolute_url)
-            parsed_base_url = urlparse(base_url)
+        for href in hrefs:
+            # Relative links resolve against the page they are on; fragments point into a page already being
+            # crawled and tracking parameters do not change it, so neither is kept
+            try:
+                absolute_url = strip_tracking(urljoin(url, href))
+                parsed_absolute_url = urlparse(absolute_url)
+                key = url_hash(absolute_url)
+            except ValueError as e:
+                # Malformed links such as "http://[bad/" cannot be resolved; skip them, not the rest of the page
+                print(f"Skipping malformed link '{href}' on '{url}': {e}")
+                log_data["errors"].append({"url": url, "error": f"malformed link '{href}': {e}"})
+                continue
+            if parsed_absolute_url.netloc.lower() != base_netloc:
+                continue
+
+            path = parsed_absolute_url.path.lower()
+            if path.endswith(SKIP_SUFFIXES) or path.startswith(SKIP_PREFIXES):
+                continue
+
+            if key not in seen:
+                seen.add(key)
+                pending.add(absolute_url)
+                queue.put_nowait(absolute_url)
+
+    async def crawl_and_checkpoint(url):
+        await crawl_page(url)
+        pending.discard(url)
+        visited.add(url_hash(url))
+        if len(visited) % CRAWL_CHECKPOINT_INTERVAL == 0:
+            save_crawl_progress(progress_filepath, visited, pending, sitemap)
+
+    # Fan the crawl out over a fixed number of workers sharing one session
+    try:
+        await run_worker_pool(queue, crawl_and_checkpoint, CRAWL_WORKERS)
+    except BaseException:
+        # Interrupted (Ctrl-C cancels the run) or crashed: save what we have so the next run resumes here
+        save_crawl_progress(progress_filepath, visited, pending, sitemap)
+        raise
 
-            if parsed_absolute_url.netloc == parsed_base_url.netloc:
-                if absolute_url not in sitemap and absolute_url not in to_visit and absolute_url not in visited:
-                    to_visit.add(absolute_url)
+    # The crawl finished, so there is nothing left to resume
+    if os.path.exists(progress_filepath):
+        os.remove(progress_filepath)
 
     return sitemap
 
@@ -219,46 +687,104 @@ async def scrape_from_sitemap(base_url, headers, base_dir):
     """Scrapes images from all URLs found in the sitemap."""
     log_data = {"downloaded": [], "skipped": [], "replaced": [], "errors": []}
     sitemap_filepath = os.path.join(base_dir, "sitemap.json")
-    sitemap_max_age = timedelta(days=7)  # Example: 7 days
 
     if os.path.exists(sitemap_filepath):
         sitemap_file_age = datetime.now() - datetime.fromtimestamp(os.path.getmtime(sitemap_filepath))
-        if sitemap_file_age > sitemap_max_age:
+        if sitemap_file_age > SITEMAP_MAX_AGE:
             print("Sitemap is older than 7 days. Recreating sitemap...")
             sitemap = None
         else:
             print("Sitemap loaded from file.")
-            with open(sitemap_filepath, "r") as f:
-                sitemap = json.load(f)
+            sitemap = read_json(sitemap_filepath)
     else:
         print("Sitemap file not found. Creating sitemap...")
         sitemap = None
 
-    if sitemap is None:
-        async with aiohttp.ClientSession() as session:
-            sitemap = await create_sitemap(session, base_url, headers, base_dir, log_data)
-            with open(sitemap_filepath, "w") as f:
-                json.dump(list(sitemap), f, indent=4)
-            print(f"Sitemap saved to {sitemap_filepath}")
-
     main_folder_name = "360_images"
     main_folder_path = os.path.join(base_dir, main_folder_name)
     os.makedirs(main_folder_path, exist_ok=True)
     csv_filepath = os.path.join(main_folder_path, "all_image_data.csv")
+    image_cache_filepath = os.path.join(main_folder_path, "image_cache.json")
+
+    # Validators, size and location of previously downloaded images, keyed by image URL
+    if os.path.exists(image_cache_filepath):
+        image_cache = read_json(image_cache_filepath)
+    else:
+        image_cache = {}
+
+    # Content digest -> file already holding those bytes, for hard-linking identical images
+    content_index = {}
+    for entry in image_cache.values():
+        if entry.get("digest"):
+            content_index.setdefault(entry["digest"], entry["filepath"])
 
     csv_buffer = []
 
-    async with aiohttp.ClientSession() as session:
-        pbar = tqdm_asyncio(total=len(sitemap), desc="Scraping Pages", position=0, leave=True)
-        try:
-            tasks = []
-            for url in sitemap:
-                tasks.append(scrape_images(session, url, headers, base_dir, None, csv_buffer, pbar, log_data))
-            await asyncio.gather(*tasks)
-        finally:
-            pbar.close()
-
-    with open(csv_filepath, "w", newline="", encoding="utf-8") as csvfile:
+    # HTML parsing is CPU-bound, so it runs across all cores instead of on the event loop
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as pool:
+        # One session for the whole run, so the crawl and the downloads share keep-alive connections
+        # and the default headers
+        connector = aiohttp.TCPConnector(limit=PAGE_WORKERS * 2, limit_per_host=DOWNLOAD_CONCURRENCY)
+        async with aiohttp.ClientSession(connector=connector, headers=headers, timeout=SESSION_TIMEOUT) as session:
+            limiter = HostRateLimiter(session)
+            if sitemap is None:
+                # Sorted, so a recrawl of the same site lists pages in the same order
+                sitemap = sorted(await create_sitemap(session, limiter, base_url, base_dir, log_data, pool))
+                write_json(sitemap_filepath, sitemap, indent=True)
+                print(f"Sitemap saved to {sitemap_filepath}")
+
+            pbar = tqdm_asyncio(total=len(sitemap), desc="Scraping Pages", unit="page", position=0, leave=True)
+            # Results are stored by sitemap position rather than completion order, so the dedup below
+            # picks the same location for a shared image on every run and the image cache keeps matching
+            discoveries = [[] for _ in sitemap]
+            page_queue = asyncio.Queue()
+            for page in enumerate(sitemap):
+                page_queue.put_nowait(page)
+
+            async def scrape_page(page):
+                index, url = page
+                discoveries[index] = await scrape_images(session, limiter, url, main_folder_path, pbar, log_data, pool)
+
+            # Fixed pools of workers keep in-flight pages and downloads bounded however large the site is
+            try:
+                await run_worker_pool(page_queue, scrape_page, PAGE_WORKERS)
+            finally:
+                pbar.close()
+
+            # Listing pages often share thumbnails, so each image URL is downloaded once, to the
+            # first location it was found at in sitemap order. Rows for the other pages point at that copy.
+            images = {}
+            for image_url, filepath, csv_row in itertools.chain.from_iterable(discoveries):
+                if image_url not in images:
+                    images[image_url] = (filepath, csv_row)
+                else:
+                    csv_row = csv_row[:2] + images[image_url][1][2:]
+                csv_buffer.append(csv_row)
+
+            # Only folders that receive a download are created, each once
+            for subfolder_path in {os.path.dirname(filepath) for filepath, _ in images.values()}:
+                os.makedirs(subfolder_path, exist_ok=True)
+
+            download_queue = asyncio.Queue()
+            for image_url, (filepath, _) in images.items():
+                download_queue.put_nowait((image_url, filepath))
+
+            download_pbar = tqdm_asyncio(total=len(images), desc="Downloading Images", unit="image", position=0, leave=True)
+
+            async def download(image):
+                image_url, filepath = image
+                await download_or_replace_image(session, limiter, image_url, filepath, log_data, image_cache, content_index)
+                download_pbar.update(1)
+
+            try:
+                await run_worker_pool(download_queue, download, DOWNLOAD_CONCURRENCY)
+            finally:
+                download_pbar.close()
+                # Saved even when interrupted (Ctrl-C cancels the run), so the next run does not fetch again
+                # what this one already downloaded
+                save_image_cache(image_cache_filepath, image_cache)
+
+    with open(csv_filepath, "w", newline="", encoding="utf-8", buffering=1 << 20) as csvfile:
         csv_writer = csv.writer(csvfile)
         csv_writer.writerow(["Old Name", "URL", "New Name", "Folder Name"])
         csv_writer.writerows(csv_buffer)
@@ -276,12 +802,6 @@ if __name__ == "__main__":
     base_dir = os.path.dirname(os.path.abspath(__file__))
     base_url = input("Enter the base URL of the website: ")
 
-    # Create the event loop
-    loop = asyncio.get_event_loop()
-    try:
-        # Run the code within the event loop
-        loop.run_until_complete(scrape_from_sitemap(base_url, headers, base_dir))
-    finally:
-        # Close the event loop
-        loop.close()
+    # asyncio.run turns Ctrl-C into a cancellation of the run, so the sitemap crawl can save its progress
+    asyncio.run(scrape_from_sitemap(base_url, headers, base_dir))
     print("Finished scraping images from sitemap.")